@@ -1,31 +1,97 @@
+# Patch the standard library before anything else imports it so sockets,
+# locks and PyMongo's I/O cooperate with the eventlet hub
+import eventlet
+eventlet.monkey_patch()
+
+from eventlet import tpool
 from flask import Flask, render_template, request, jsonify, session
+from flask.json.provider import JSONProvider
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from pymongo.write_concern import WriteConcern
 from bson import ObjectId
+from bson.codec_options import CodecOptions
 from bson.errors import InvalidId
+from bson.raw_bson import RawBSONDocument
 from datetime import datetime, timedelta
 import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 import jwt
+import orjson
 import os
 from dotenv import load_dotenv
 from functools import wraps
+from cachetools import TTLCache
+import hashlib
+import threading
+import time
 import json
-import random
-import string
+import base64
+import secrets
+from config import Config
 
 # Load environment variables
 load_dotenv()
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for faster response serialization"""
+
+    @staticmethod
+    def _default(obj):
+        if isinstance(obj, ObjectId):
+            return str(obj)
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    # orjson takes no encoder/decoder options, so calls that pass any (e.g. the
+    # session serializer's separators and object_hook) go through the stdlib
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', self._default)
+            return json.dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self._default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+class OrjsonSocketIOJSON:
+    """orjson-backed json module for SocketIO packet encoding"""
+
+    # python-socketio always passes separators=(',', ':'); orjson output is already compact
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj, default=OrjsonProvider._default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key')
 
 # Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True, async_mode='threading')
+# A message queue (e.g. redis://localhost:6379/0) lets several workers share broadcasts.
+# Packet logging is only enabled in debug mode, and clients must connect over websocket.
+socketio = SocketIO(app, cors_allowed_origins="*", logger=Config.DEBUG, engineio_logger=Config.DEBUG,
+                    async_mode='eventlet', message_queue=Config.SOCKETIO_MESSAGE_QUEUE, json=OrjsonSocketIOJSON,
+                    transports=['websocket'], ping_interval=Config.SOCKETIO_PING_INTERVAL,
+                    ping_timeout=Config.SOCKETIO_PING_TIMEOUT, max_http_buffer_size=Config.SOCKETIO_MAX_BUFFER_SIZE)
 
 # MongoDB connection
 mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/chat_app')
-client = MongoClient(mongo_uri)
+client = MongoClient(
+    mongo_uri,
+    maxPoolSize=Config.DB_MAX_POOL_SIZE,
+    minPoolSize=Config.DB_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=Config.DB_CONNECTION_TIMEOUT,
+    compressors=Config.DB_COMPRESSORS,
+    retryWrites=True
+)
 db = client.chat_app
 
 # Collections
@@ -35,30 +101,247 @@ messages_collection = db.messages
 sessions_collection = db.user_sessions
 private_messages_collection = db.private_messages
 
+# Presence updates are non-critical, so they skip waiting on the journal
+presence_users_collection = users_collection.with_options(write_concern=WriteConcern(w=1, j=False))
+
+# Read-only handles for listing endpoints; RawBSONDocument defers BSON decoding until fields are read
+_raw_codec_options = CodecOptions(document_class=RawBSONDocument)
+rooms_raw_collection = rooms_collection.with_options(codec_options=_raw_codec_options)
+messages_raw_collection = messages_collection.with_options(codec_options=_raw_codec_options)
+
 # JWT configuration
 JWT_SECRET = os.getenv('JWT_SECRET_KEY', 'super-secret-key')
 JWT_ALGORITHM = 'HS256'
 
 # Store active users and their socket IDs
 active_users = {}
+active_users_lock = threading.RLock()
+
+# Password hashing is CPU-bound C code, so it runs on eventlet's native
+# thread pool instead of blocking the hub
+tpool.set_num_threads(Config.AUTH_POOL_SIZE)
+
+# Short-lived caches for decoded tokens and user documents
+_jwt_cache = TTLCache(maxsize=Config.JWT_CACHE_SIZE, ttl=Config.JWT_CACHE_TTL)
+_user_cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+_room_cache = TTLCache(maxsize=Config.ROOM_CACHE_SIZE, ttl=Config.ROOM_CACHE_TTL)
+_membership_cache = TTLCache(maxsize=Config.MEMBERSHIP_CACHE_SIZE, ttl=Config.MEMBERSHIP_CACHE_TTL)
+_cache_lock = threading.Lock()
+
+# Pending presence updates keyed by user ObjectId, written in batches by _flush_presence
+_presence_queue = {}
+_presence_lock = threading.Lock()
+_presence_flusher_started = False
+
+# Messages already broadcast but not yet saved, written in batches by _flush_messages
+_message_queue = []
+_message_lock = threading.Lock()
+_message_flusher_started = False
 
 # Utility functions
+# New passwords are hashed with argon2id; bcrypt hashes from older accounts
+# are still accepted and upgraded on the next successful login
+password_hasher = PasswordHasher(
+    time_cost=Config.ARGON2_TIME_COST,
+    memory_cost=Config.ARGON2_MEMORY_COST,
+    parallelism=Config.ARGON2_PARALLELISM
+)
+
+# bcrypt only uses the first 72 bytes of a password
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+def _password_bytes(password):
+    """Encode a password, truncated to the part bcrypt actually reads"""
+    return password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+
+def _is_argon2_hash(hashed):
+    """Check if a stored hash is in argon2's encoded format"""
+    return isinstance(hashed, str) and hashed.startswith('$argon2')
+
 def hash_password(password):
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    """Hash a password using argon2id"""
+    return password_hasher.hash(password)
 
 def check_password(password, hashed):
-    """Check if a password matches its hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed)
+    """Check if a password matches its hash (argon2id, or bcrypt for older accounts)"""
+    if _is_argon2_hash(hashed):
+        try:
+            return password_hasher.verify(hashed, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return bcrypt.checkpw(_password_bytes(password), hashed)
+
+def password_needs_rehash(hashed):
+    """Check if a hash is bcrypt or uses outdated argon2 parameters"""
+    return not _is_argon2_hash(hashed) or password_hasher.check_needs_rehash(hashed)
 
 def generate_room_id():
-    """Generate a unique 8-character alphanumeric room ID for private rooms"""
-    characters = string.ascii_uppercase + string.digits
+    """Generate an 8-character alphanumeric room ID for private rooms
+
+    Five random bytes base32-encode to exactly 8 characters (A-Z, 2-7).
+    Uniqueness is enforced by the unique index on room_id at insert time.
+    """
+    return base64.b32encode(secrets.token_bytes(5)).decode('ascii')
+
+def queue_presence(user_id, is_online):
+    """Record a user's online status to be written on the next presence flush"""
+    global _presence_flusher_started
+    now = datetime.utcnow()
+    with _presence_lock:
+        _presence_queue[user_id] = {'is_online': is_online, 'last_seen': now, 'updated_at': now}
+        if not _presence_flusher_started:
+            _presence_flusher_started = True
+            socketio.start_background_task(_flush_presence)
+
+def _flush_presence():
+    """Background task that writes queued presence updates with one bulk_write"""
     while True:
-        room_id = ''.join(random.choice(characters) for _ in range(8))
-        # Check if room_id already exists
-        if not rooms_collection.find_one({'room_id': room_id}):
-            return room_id
+        socketio.sleep(Config.PRESENCE_FLUSH_INTERVAL)
+        with _presence_lock:
+            batch = _presence_queue.copy()
+            _presence_queue.clear()
+        if not batch:
+            continue
+        
+        updates = list(batch.items())
+        failed = set()
+        try:
+            presence_users_collection.bulk_write(
+                [UpdateOne({'_id': user_id}, {'$set': fields}) for user_id, fields in updates],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            print(f"Error flushing presence updates: {e}")
+            failed = {error['index'] for error in e.details['writeErrors']}
+        except Exception as e:
+            print(f"Error flushing presence updates: {e}")
+            failed = set(range(len(updates)))
+        
+        # Put failed updates back for the next flush unless a newer one was queued meanwhile
+        if failed:
+            with _presence_lock:
+                for index in failed:
+                    user_id, fields = updates[index]
+                    _presence_queue.setdefault(user_id, fields)
+        
+        for index, (user_id, _) in enumerate(updates):
+            if index not in failed:
+                invalidate_user(user_id)
+
+def queue_message(message_doc):
+    """Queue a message document to be inserted on the next message flush"""
+    global _message_flusher_started
+    with _message_lock:
+        _message_queue.append(message_doc)
+        if not _message_flusher_started:
+            _message_flusher_started = True
+            socketio.start_background_task(_flush_messages)
+
+def _flush_messages():
+    """Background task that inserts queued messages with one insert_many"""
+    while True:
+        socketio.sleep(Config.MESSAGE_FLUSH_INTERVAL)
+        with _message_lock:
+            batch = _message_queue[:]
+            _message_queue.clear()
+        if not batch:
+            continue
+        
+        try:
+            messages_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # The rest of the batch was written; a duplicate key means an earlier
+            # retry already saved that message
+            for error in e.details['writeErrors']:
+                if error['code'] != 11000:
+                    print(f"Error saving message {batch[error['index']]['_id']}: {error['errmsg']}")
+        except Exception as e:
+            # These messages were already broadcast, so put them back for the next flush
+            print(f"Error saving queued messages, will retry: {e}")
+            with _message_lock:
+                _message_queue[:0] = batch
+
+def get_room(room_object_id):
+    """Fetch a room's name and type, served from the room cache when possible"""
+    with _cache_lock:
+        room = _room_cache.get(room_object_id)
+    if room is None:
+        room = rooms_collection.find_one({'_id': room_object_id}, {'name': 1, 'type': 1})
+        if room:
+            with _cache_lock:
+                _room_cache[room_object_id] = room
+    return room
+
+def is_room_member(room_object_id, user_id):
+    """Check room membership with an index probe instead of scanning the members array"""
+    key = (room_object_id, user_id)
+    with _cache_lock:
+        if key in _membership_cache:
+            return True
+    
+    is_member = rooms_collection.count_documents(
+        {'_id': room_object_id, 'members.user_id': user_id}, limit=1
+    ) > 0
+    # Only positive results are cached; a join is recorded with mark_room_member
+    if is_member:
+        mark_room_member(room_object_id, user_id)
+    return is_member
+
+def add_room_member(room_object_id, user_id):
+    """Atomically add a user to a room unless already a member; returns True if added"""
+    with _cache_lock:
+        if (room_object_id, user_id) in _membership_cache:
+            return False
+    
+    result = rooms_collection.update_one(
+        {'_id': room_object_id, 'members.user_id': {'$ne': user_id}},
+        {
+            '$push': {
+                'members': {
+                    'user_id': user_id,
+                    'joined_at': datetime.utcnow(),
+                    'role': 'member'
+                }
+            }
+        }
+    )
+    mark_room_member(room_object_id, user_id)
+    return result.modified_count == 1
+
+def mark_room_member(room_object_id, user_id):
+    """Record a known membership in the membership cache"""
+    with _cache_lock:
+        _membership_cache[(room_object_id, user_id)] = True
+
+def list_rooms(query):
+    """Fetch rooms for listing, counting members server-side instead of loading them"""
+    return list(rooms_raw_collection.aggregate([
+        {'$match': query},
+        {'$project': {
+            'name': 1,
+            'description': 1,
+            'type': 1,
+            'room_id': 1,
+            'owner_id': 1,
+            'created_at': 1,
+            'member_count': {'$size': {'$ifNull': ['$members', []]}}
+        }}
+    ]))
+
+def format_message(message):
+    """Format a message joined with its sender for the messages API"""
+    sender = message.get('sender')
+    return {
+        'id': str(message['_id']),
+        'content': message['content'],
+        'sender': {
+            'id': str(sender['_id']),
+            'username': sender['username'],
+            'display_name': sender['display_name']
+        } if sender else None,
+        'timestamp': message['timestamp'].isoformat(),
+        'edited': message.get('edited', False)
+    }
 
 def generate_token(user_id):
     """Generate JWT token for user"""
@@ -70,13 +353,39 @@ def generate_token(user_id):
 
 def verify_token(token):
     """Verify JWT token and return user_id"""
+    key = hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+    with _cache_lock:
+        cached = _jwt_cache.get(key)
+    if cached:
+        user_id, exp = cached
+        return user_id if exp > time.time() else None
+    
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload['user_id']
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    
+    with _cache_lock:
+        _jwt_cache[key] = (payload['user_id'], payload['exp'])
+    return payload['user_id']
+
+def get_user(user_id):
+    """Fetch a user document by ID, served from the user cache when possible"""
+    with _cache_lock:
+        user = _user_cache.get(user_id)
+    if user is None:
+        user = users_collection.find_one({'_id': ObjectId(user_id)}, {'password_hash': 0})
+        if user:
+            with _cache_lock:
+                _user_cache[user_id] = user
+    return user
+
+def invalidate_user(user_id):
+    """Drop a user from the user cache after their document changes"""
+    with _cache_lock:
+        _user_cache.pop(str(user_id), None)
 
 def token_required(f):
     """Decorator to require valid JWT token"""
@@ -94,7 +403,7 @@ def token_required(f):
             return jsonify({'error': 'Token is invalid'}), 401
         
         try:
-            user = users_collection.find_one({'_id': ObjectId(user_id)})
+            user = get_user(user_id)
             if not user:
                 return jsonify({'error': 'User not found'}), 401
         except InvalidId:
@@ -115,7 +424,7 @@ def socketio_token_required(f):
             return
         
         try:
-            user = users_collection.find_one({'_id': ObjectId(auth_data['user_id'])})
+            user = get_user(auth_data['user_id'])
             if not user:
                 emit('error', {'message': 'User not found'})
                 return
@@ -127,6 +436,36 @@ def socketio_token_required(f):
     
     return decorated
 
+def create_indexes():
+    """Create database indexes for better performance"""
+    try:
+        # Users collection indexes
+        users_collection.create_index('username', unique=True)
+        users_collection.create_index('email', unique=True)
+        users_collection.create_index('is_online')
+        
+        # Rooms collection indexes
+        rooms_collection.create_index('name')
+        rooms_collection.create_index('type')
+        rooms_collection.create_index('room_id', unique=True, sparse=True)  # Sparse index for room_id (only private rooms)
+        rooms_collection.create_index('owner_id')
+        rooms_collection.create_index([('members.user_id', 1), ('type', 1), ('is_active', 1)])  # Private room lookups
+        rooms_collection.create_index([('type', 1), ('is_active', 1), ('name', 1)])  # Public room listing
+        
+        # Messages collection indexes
+        messages_collection.create_index('room_id')
+        messages_collection.create_index('sender_id')
+        messages_collection.create_index('timestamp')
+        messages_collection.create_index([('room_id', 1), ('timestamp', -1)])
+        
+        print("Database indexes created successfully")
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+
+# Created at import so WSGI servers (e.g. gunicorn app:app) get them too;
+# create_room relies on the unique room_id index to reject duplicate IDs
+create_indexes()
+
 # Routes
 @app.route('/')
 def index():
@@ -217,14 +556,14 @@ def register():
         display_name = data.get('display_name', username)
         
         # Check if user already exists
-        if users_collection.find_one({'$or': [{'username': username}, {'email': email}]}):
+        if users_collection.find_one({'$or': [{'username': username}, {'email': email}]}, {'_id': 1}):
             return jsonify({'error': 'Username or email already exists'}), 409
         
         # Create new user
         user_doc = {
             'username': username,
             'email': email,
-            'password_hash': hash_password(password),
+            'password_hash': tpool.execute(hash_password, password),
             'display_name': display_name,
             'avatar_url': data.get('avatar_url', ''),
             'is_online': False,
@@ -266,21 +605,22 @@ def login():
         password = data['password']
         
         # Find user
-        user = users_collection.find_one({'username': username})
-        if not user or not check_password(password, user['password_hash']):
+        user = users_collection.find_one(
+            {'username': username},
+            {'username': 1, 'email': 1, 'display_name': 1, 'avatar_url': 1, 'password_hash': 1}
+        )
+        if not user or not tpool.execute(check_password, password, user['password_hash']):
             return jsonify({'error': 'Invalid username or password'}), 401
         
+        # Upgrade bcrypt or outdated argon2 hashes now that the password is known
+        if password_needs_rehash(user['password_hash']):
+            users_collection.update_one(
+                {'_id': user['_id']},
+                {'$set': {'password_hash': tpool.execute(hash_password, password)}}
+            )
+        
         # Update user status
-        users_collection.update_one(
-            {'_id': user['_id']},
-            {
-                '$set': {
-                    'is_online': True,
-                    'last_seen': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
-                }
-            }
-        )
+        queue_presence(user['_id'], True)
         
         # Generate token
         token = generate_token(user['_id'])
@@ -308,16 +648,7 @@ def logout():
         user = request.current_user
         
         # Update user status
-        users_collection.update_one(
-            {'_id': user['_id']},
-            {
-                '$set': {
-                    'is_online': False,
-                    'last_seen': datetime.utcnow(),
-                    'updated_at': datetime.utcnow()
-                }
-            }
-        )
+        queue_presence(user['_id'], False)
         
         return jsonify({'message': 'Logout successful'}), 200
     
@@ -364,6 +695,7 @@ def edit_profile():
         if update_fields:
             update_fields['updated_at'] = datetime.utcnow()
             users_collection.update_one({'_id': user['_id']}, {'$set': update_fields})
+            invalidate_user(user['_id'])
         return jsonify({'message': 'Profile updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -376,14 +708,14 @@ def get_rooms():
         user = request.current_user
         
         # Get all public rooms
-        public_rooms = list(rooms_collection.find({'type': 'public', 'is_active': True}))
+        public_rooms = list_rooms({'type': 'public', 'is_active': True})
         
         # Get user's private rooms (where user is a member)
-        private_rooms = list(rooms_collection.find({
+        private_rooms = list_rooms({
             'type': 'private',
             'is_active': True,
             'members.user_id': user['_id']
-        }))
+        })
         
         # Combine and format rooms
         all_rooms = []
@@ -395,7 +727,7 @@ def get_rooms():
                 'name': room['name'],
                 'description': room.get('description', ''),
                 'type': room['type'],
-                'member_count': len(room.get('members', [])),
+                'member_count': room['member_count'],
                 'created_at': room['created_at'].isoformat()
             }
             all_rooms.append(room_data)
@@ -409,7 +741,7 @@ def get_rooms():
                 'type': room['type'],
                 'room_id': room.get('room_id'),
                 'owner_id': str(room['owner_id']),
-                'member_count': len(room.get('members', [])),
+                'member_count': room['member_count'],
                 'created_at': room['created_at'].isoformat()
             }
             all_rooms.append(room_data)
@@ -424,7 +756,7 @@ def get_rooms():
 def get_public_rooms():
     """Get all public rooms"""
     try:
-        rooms = list(rooms_collection.find({'type': 'public', 'is_active': True}))
+        rooms = list_rooms({'type': 'public', 'is_active': True})
         
         room_list = []
         for room in rooms:
@@ -433,7 +765,7 @@ def get_public_rooms():
                 'name': room['name'],
                 'description': room.get('description', ''),
                 'type': room['type'],
-                'member_count': len(room.get('members', [])),
+                'member_count': room['member_count'],
                 'created_at': room['created_at'].isoformat()
             }
             room_list.append(room_data)
@@ -451,11 +783,11 @@ def get_private_rooms():
         user = request.current_user
         
         # Get user's private rooms (where user is a member)
-        rooms = list(rooms_collection.find({
+        rooms = list_rooms({
             'type': 'private',
             'is_active': True,
             'members.user_id': user['_id']
-        }))
+        })
         
         room_list = []
         for room in rooms:
@@ -466,7 +798,7 @@ def get_private_rooms():
                 'type': room['type'],
                 'room_id': room.get('room_id'),
                 'owner_id': str(room['owner_id']),
-                'member_count': len(room.get('members', [])),
+                'member_count': room['member_count'],
                 'created_at': room['created_at'].isoformat()
             }
             room_list.append(room_data)
@@ -497,15 +829,13 @@ def join_room_by_id():
             'room_id': room_id,
             'type': 'private',
             'is_active': True
-        })
+        }, {'name': 1, 'description': 1})
         
         if not room:
             return jsonify({'error': 'Room not found. Please check the Room ID and try again.'}), 404
         
-        # Check if user is already a member
-        is_member = any(member['user_id'] == user['_id'] for member in room.get('members', []))
-        
-        if is_member:
+        # Add user to room members (no-op if already a member)
+        if not add_room_member(room['_id'], user['_id']):
             return jsonify({
                 'message': 'You are already a member of this room',
                 'room': {
@@ -515,20 +845,6 @@ def join_room_by_id():
                 }
             }), 200
         
-        # Add user to room members
-        rooms_collection.update_one(
-            {'_id': room['_id']},
-            {
-                '$push': {
-                    'members': {
-                        'user_id': user['_id'],
-                        'joined_at': datetime.utcnow(),
-                        'role': 'member'
-                    }
-                }
-            }
-        )
-        
         return jsonify({
             'message': 'Successfully joined the private room!',
             'room': {
@@ -561,7 +877,7 @@ def create_room():
             return jsonify({'error': 'Room type must be public or private'}), 400
         
         # Check if room name already exists (only for public rooms)
-        if room_type == 'public' and rooms_collection.find_one({'name': name, 'type': 'public'}):
+        if room_type == 'public' and rooms_collection.find_one({'name': name, 'type': 'public'}, {'_id': 1}):
             return jsonify({'error': 'Public room name already exists'}), 409
         
         # Generate room ID for private rooms
@@ -590,7 +906,16 @@ def create_room():
         if room_type == 'private':
             room_doc['room_id'] = room_id
         
-        result = rooms_collection.insert_one(room_doc)
+        # Retry with a fresh room_id in the unlikely event of a collision
+        for attempt in range(5):
+            try:
+                result = rooms_collection.insert_one(room_doc)
+                break
+            except DuplicateKeyError:
+                if room_type != 'private' or attempt == 4:
+                    raise
+                room_doc.pop('_id', None)
+                room_id = room_doc['room_id'] = generate_room_id()
         room_object_id = result.inserted_id
         
         response_data = {
@@ -625,14 +950,13 @@ def get_room_messages(room_id):
         
         # Check if user has access to room
         user = request.current_user
-        room = rooms_collection.find_one({'_id': room_object_id})
+        room = get_room(room_object_id)
         
         if not room:
             return jsonify({'error': 'Room not found'}), 404
         
         # Check if user is member of the room
-        is_member = any(member['user_id'] == user['_id'] for member in room.get('members', []))
-        if not is_member and room['type'] == 'private':
+        if room['type'] == 'private' and not is_room_member(room_object_id, user['_id']):
             return jsonify({'error': 'Access denied'}), 403
         
         # Get messages with pagination
@@ -640,26 +964,32 @@ def get_room_messages(room_id):
         limit = int(request.args.get('limit', 50))
         skip = (page - 1) * limit
         
-        messages = list(messages_collection.find(
-            {'room_id': room_object_id, 'deleted': {'$ne': True}}
-        ).sort('timestamp', -1).skip(skip).limit(limit))
-        
-        # Get sender information for each message
-        message_list = []
-        for message in reversed(messages):  # Reverse to get chronological order
-            sender = users_collection.find_one({'_id': message['sender_id']})
-            message_data = {
-                'id': str(message['_id']),
-                'content': message['content'],
-                'sender': {
-                    'id': str(sender['_id']),
-                    'username': sender['username'],
-                    'display_name': sender['display_name']
-                } if sender else None,
-                'timestamp': message['timestamp'].isoformat(),
-                'edited': message.get('edited', False)
-            }
-            message_list.append(message_data)
+        # Join sender information in the same query instead of one lookup per message
+        pipeline = [
+            {'$match': {'room_id': room_object_id, 'deleted': {'$ne': True}}},
+            {'$sort': {'timestamp': -1}},
+            {'$skip': skip},
+            {'$limit': limit},
+            {'$lookup': {
+                'from': users_collection.name,
+                'localField': 'sender_id',
+                'foreignField': '_id',
+                'as': 'sender'
+            }},
+            {'$unwind': {'path': '$sender', 'preserveNullAndEmptyArrays': True}},
+            {'$project': {
+                'content': 1,
+                'timestamp': 1,
+                'edited': 1,
+                'sender._id': 1,
+                'sender.username': 1,
+                'sender.display_name': 1
+            }}
+        ]
+        messages = messages_raw_collection.aggregate(pipeline)
+        
+        # Reverse to get chronological order
+        message_list = [format_message(message) for message in messages][::-1]
         
         return jsonify({'messages': message_list}), 200
     
@@ -687,7 +1017,7 @@ def handle_authenticate(data):
             emit('auth_error', {'message': 'Invalid token'})
             return
         
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
+        user = get_user(user_id)
         if not user:
             emit('auth_error', {'message': 'User not found'})
             return
@@ -696,17 +1026,15 @@ def handle_authenticate(data):
         session['auth_data'] = {'user_id': user_id, 'username': user['username']}
         
         # Update user online status
-        users_collection.update_one(
-            {'_id': user['_id']},
-            {'$set': {'is_online': True, 'last_seen': datetime.utcnow()}}
-        )
+        queue_presence(user['_id'], True)
         
         # Store active user
-        active_users[request.sid] = {
-            'user_id': user_id,
-            'username': user['username'],
-            'display_name': user['display_name']
-        }
+        with active_users_lock:
+            active_users[request.sid] = {
+                'user_id': user['_id'],
+                'username': user['username'],
+                'display_name': user['display_name']
+            }
         
         emit('authenticated', {'message': 'Authentication successful', 'user': {
             'id': str(user['_id']),
@@ -741,28 +1069,13 @@ def handle_join_room(user, data):
             emit('error', {'message': 'Invalid room ID'})
             return
         
-        room = rooms_collection.find_one({'_id': room_object_id})
+        room = get_room(room_object_id)
         if not room:
             emit('error', {'message': 'Room not found'})
             return
         
-        # Check if user is already a member
-        is_member = any(member['user_id'] == user['_id'] for member in room.get('members', []))
-        
-        if not is_member:
-            # Add user to room members
-            rooms_collection.update_one(
-                {'_id': room_object_id},
-                {
-                    '$push': {
-                        'members': {
-                            'user_id': user['_id'],
-                            'joined_at': datetime.utcnow(),
-                            'role': 'member'
-                        }
-                    }
-                }
-            )
+        # Add user to room members (no-op if already a member)
+        add_room_member(room_object_id, user['_id'])
         
         # Join the SocketIO room
         join_room(room_id)
@@ -825,13 +1138,15 @@ def handle_send_message(user, data):
             emit('error', {'message': 'Invalid room ID'})
             return
         
-        room = rooms_collection.find_one({'_id': room_object_id})
+        room = get_room(room_object_id)
         if not room:
             emit('error', {'message': 'Room not found'})
             return
         
-        # Create message document
+        # Create message document; the ID is generated locally so it can be broadcast before saving
+        message_id = ObjectId()
         message_doc = {
+            '_id': message_id,
             'room_id': room_object_id,
             'sender_id': user['_id'],
             'content': content,
@@ -841,10 +1156,6 @@ def handle_send_message(user, data):
             'timestamp': datetime.utcnow()
         }
         
-        # Save message to database
-        result = messages_collection.insert_one(message_doc)
-        message_id = result.inserted_id
-        
         # Prepare message data for broadcasting
         message_data = {
             'id': str(message_id),
@@ -861,6 +1172,9 @@ def handle_send_message(user, data):
         # Broadcast message to all users in the room
         socketio.emit('new_message', message_data, room=room_id)
         
+        # Save message to database in the next batch
+        queue_message(message_doc)
+        
     except Exception as e:
         emit('error', {'message': str(e)})
 
@@ -896,49 +1210,22 @@ def handle_disconnect():
     print(f'Client disconnected: {request.sid}')
     
     # Remove user from active users
-    if request.sid in active_users:
-        user_data = active_users[request.sid]
+    with active_users_lock:
+        user_data = active_users.pop(request.sid, None)
+    
+    if user_data:
         user_id = user_data['user_id']
         
         # Update user online status
-        users_collection.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$set': {'is_online': False, 'last_seen': datetime.utcnow()}}
-        )
+        queue_presence(user_id, False)
         
         # Broadcast user offline status
         socketio.emit('user_offline', {
-            'user_id': user_id,
+            'user_id': str(user_id),
             'username': user_data['username']
         })
-        
-        del active_users[request.sid]
 
 if __name__ == '__main__':
-    # Create indexes for better performance
-    try:
-        # Users collection indexes
-        users_collection.create_index('username', unique=True)
-        users_collection.create_index('email', unique=True)
-        users_collection.create_index('is_online')
-        
-        # Rooms collection indexes
-        rooms_collection.create_index('name')
-        rooms_collection.create_index('type')
-        rooms_collection.create_index('room_id', unique=True, sparse=True)  # Sparse index for room_id (only private rooms)
-        rooms_collection.create_index('owner_id')
-        rooms_collection.create_index('members.user_id')
-        
-        # Messages collection indexes
-        messages_collection.create_index('room_id')
-        messages_collection.create_index('sender_id')
-        messages_collection.create_index('timestamp')
-        messages_collection.create_index([('room_id', 1), ('timestamp', -1)])
-        
-        print("Database indexes created successfully")
-    except Exception as e:
-        print(f"Error creating indexes: {e}")
-    
     # Run the application
     port = int(os.getenv('PORT', 5000))
     socketio.run(app, host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
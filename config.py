@@ -19,11 +19,33 @@ class Config:
     # MongoDB settings
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/chat_app')
     
+    # SocketIO settings
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')  # e.g. redis://localhost:6379/0
+    SOCKETIO_PING_INTERVAL = 25  # seconds
+    SOCKETIO_PING_TIMEOUT = 20  # seconds
+    SOCKETIO_MAX_BUFFER_SIZE = 64 * 1024  # 64KB, well above MAX_MESSAGE_LENGTH
+    
     # JWT settings
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'super-secret-jwt-key-change-in-production')
     JWT_ALGORITHM = 'HS256'
     JWT_EXPIRATION_HOURS = 24
     
+    # Password hashing settings
+    ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '2'))
+    ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '19456'))  # KiB
+    ARGON2_PARALLELISM = 1
+    AUTH_POOL_SIZE = int(os.getenv('AUTH_POOL_SIZE', os.cpu_count() or 4))  # native threads for hashing
+    
+    # Cache settings
+    JWT_CACHE_SIZE = 10000
+    JWT_CACHE_TTL = 5  # seconds
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 30  # seconds
+    ROOM_CACHE_SIZE = 5000
+    ROOM_CACHE_TTL = 30  # seconds
+    MEMBERSHIP_CACHE_SIZE = 50000
+    MEMBERSHIP_CACHE_TTL = 10  # seconds
+    
     # Application settings
     MAX_MESSAGE_LENGTH = 1000
     MAX_ROOM_NAME_LENGTH = 50
@@ -41,6 +63,10 @@ class Config:
     # Database settings
     DB_CONNECTION_TIMEOUT = 5000  # milliseconds
     DB_MAX_POOL_SIZE = 50
+    DB_MIN_POOL_SIZE = 10
+    DB_COMPRESSORS = os.getenv('DB_COMPRESSORS', 'zstd,zlib')  # wire compression, in order of preference
+    PRESENCE_FLUSH_INTERVAL = 2  # seconds between batched presence writes
+    MESSAGE_FLUSH_INTERVAL = 0.1  # seconds between batched message inserts
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -337,7 +337,8 @@ function showToast(message, type = 'success') {
 
 // Socket.IO functions
 function initializeSocket() {
-    socket = io();
+    // The server only accepts websocket connections (no long-polling fallback)
+    socket = io({ transports: ['websocket'] });
     
     // Connection events
     socket.on('connect', function() {
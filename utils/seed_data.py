@@ -3,10 +3,16 @@ Database seeder script for creating sample data
 Run this script to populate the database with sample users and rooms
 """
 
-from pymongo import MongoClient
-from datetime import datetime
-import bcrypt
+from pymongo import MongoClient, IndexModel, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher
+from pathlib import Path
+import orjson
 import os
+import secrets
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -14,7 +20,14 @@ load_dotenv()
 
 # MongoDB connection
 mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/chat_app')
-client = MongoClient(mongo_uri)
+# The seeder issues one bulk command at a time, so a small pool is enough;
+# wire compression shrinks the bulk inserts (zstd needs the zstandard package)
+client = MongoClient(
+    mongo_uri,
+    maxPoolSize=10,
+    compressors=os.getenv('DB_COMPRESSORS', 'zstd,zlib'),
+    retryWrites=True
+)
 db = client.chat_app
 
 # Collections
@@ -22,72 +35,114 @@ users_collection = db.users
 rooms_collection = db.chat_rooms
 messages_collection = db.messages
 
-def hash_password(password):
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+# Sample users, rooms and messages, parsed once at import
+FIXTURES_PATH = Path(__file__).with_name('seed_fixtures.json')
+FIXTURES = orjson.loads(FIXTURES_PATH.read_bytes())
+
+# Fire-and-forget handle for seed messages; they have no uniqueness to check and
+# losing one is harmless. Users and rooms stay acknowledged so duplicates are reported.
+fast_messages_collection = messages_collection.with_options(write_concern=WriteConcern(w=0))
+
+# Sample accounts have published passwords, so production-strength parameters
+# only slow seeding down; the app upgrades these hashes on first login
+SEED_PASSWORD_HASHER = PasswordHasher(time_cost=1, memory_cost=8192, parallelism=1)
+
+def hash_password(password, hasher, salt=None):
+    """Hash a password using argon2id with the given PasswordHasher"""
+    return hasher.hash(password, salt=salt)
 
 def create_sample_users():
     """Create sample users"""
     print("Creating sample users...")
+    now = datetime.utcnow()
+    
+    # Find existing users with one query so their passwords are never hashed;
+    # the metadata-only count skips that query on an empty collection
+    existing = set()
+    if users_collection.estimated_document_count():
+        existing = {user['username'] for user in users_collection.find(
+            {'username': {'$in': [user['username'] for user in FIXTURES['users']]}}, {'username': 1}
+        )}
+    new_users = []
+    for user in FIXTURES['users']:
+        if user['username'] in existing:
+            print(f"User {user['username']} already exists, skipping...")
+        else:
+            new_users.append(user)
+    if not new_users:
+        return
+    
+    # Each distinct password is hashed once (sample users may share a hash),
+    # with salts sliced from a single CSPRNG read; argon2 releases the GIL,
+    # so the hashes can run on all cores at once
+    unique_passwords = list(dict.fromkeys(user['password'] for user in new_users))
+    salt_len = SEED_PASSWORD_HASHER.salt_len
+    salt_pool = secrets.token_bytes(salt_len * len(unique_passwords))
+    salts = [salt_pool[i * salt_len:(i + 1) * salt_len] for i in range(len(unique_passwords))]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        hashes = dict(zip(unique_passwords, executor.map(
+            lambda password, salt: hash_password(password, hasher=SEED_PASSWORD_HASHER, salt=salt),
+            unique_passwords, salts
+        )))
     
     sample_users = [
         {
-            'username': 'admin',
-            'email': 'admin@chatapp.com',
-            'password_hash': hash_password('admin123'),
-            'display_name': 'Administrator',
-            'avatar_url': '',
-            'is_online': False,
-            'last_seen': datetime.utcnow(),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        },
-        {
-            'username': 'john_doe',
-            'email': 'john@example.com',
-            'password_hash': hash_password('password123'),
-            'display_name': 'John Doe',
-            'avatar_url': '',
-            'is_online': False,
-            'last_seen': datetime.utcnow(),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        },
-        {
-            'username': 'jane_smith',
-            'email': 'jane@example.com',
-            'password_hash': hash_password('password123'),
-            'display_name': 'Jane Smith',
-            'avatar_url': '',
-            'is_online': False,
-            'last_seen': datetime.utcnow(),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        },
-        {
-            'username': 'bob_wilson',
-            'email': 'bob@example.com',
-            'password_hash': hash_password('password123'),
-            'display_name': 'Bob Wilson',
-            'avatar_url': '',
+            'username': user['username'],
+            'email': user['email'],
+            'password_hash': hashes[user['password']],
+            'display_name': user['display_name'],
+            'avatar_url': user['avatar_url'],
             'is_online': False,
-            'last_seen': datetime.utcnow(),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
+            'last_seen': now,
+            'created_at': now,
+            'updated_at': now
         }
+        for user in new_users
     ]
     
-    for user in sample_users:
-        # Check if user already exists
-        if not users_collection.find_one({'username': user['username']}):
-            result = users_collection.insert_one(user)
-            print(f"Created user: {user['username']} (ID: {result.inserted_id})")
-        else:
+    # Upsert on username so users created since the check above are left
+    # untouched; the unique email index still rejects a taken email
+    create_indexes()
+    
+    failed = set()
+    try:
+        result = users_collection.bulk_write(
+            [UpdateOne({'username': user['username']}, {'$setOnInsert': user}, upsert=True) for user in sample_users],
+            ordered=False
+        )
+        created = result.upserted_ids
+    except BulkWriteError as e:
+        created = {upsert['index']: upsert['_id'] for upsert in e.details['upserted']}
+        for error in e.details['writeErrors']:
+            print(f"Error creating user {sample_users[error['index']]['username']}: {error['errmsg']}")
+            failed.add(error['index'])
+    
+    for index, user in enumerate(sample_users):
+        if index in created:
+            print(f"Created user: {user['username']} (ID: {created[index]})")
+        elif index not in failed:
             print(f"User {user['username']} already exists, skipping...")
 
 def create_sample_rooms():
     """Create sample chat rooms"""
     print("Creating sample rooms...")
+    now = datetime.utcnow()
+    
+    # Find existing rooms with one query and only build the missing ones;
+    # the metadata-only count skips that query on an empty collection
+    existing = set()
+    if rooms_collection.estimated_document_count():
+        existing = {(room['name'], room['type']) for room in rooms_collection.find(
+            {'name': {'$in': [room['name'] for room in FIXTURES['rooms']]}}, {'name': 1, 'type': 1}
+        )}
+    new_rooms = []
+    for room in FIXTURES['rooms']:
+        if (room['name'], room['type']) in existing:
+            print(f"Room {room['name']} already exists, skipping...")
+        else:
+            new_rooms.append(room)
+    if not new_rooms:
+        return
     
     # Get admin user for room ownership
     admin_user = users_collection.find_one({'username': 'admin'})
@@ -97,72 +152,34 @@ def create_sample_rooms():
     
     sample_rooms = [
         {
-            'name': 'General',
-            'description': 'General discussion room for everyone',
-            'type': 'public',
-            'owner_id': admin_user['_id'],
-            'members': [{
-                'user_id': admin_user['_id'],
-                'joined_at': datetime.utcnow(),
-                'role': 'admin'
-            }],
-            'max_members': None,
-            'is_active': True,
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        },
-        {
-            'name': 'Technology',
-            'description': 'Discuss the latest in technology and programming',
-            'type': 'public',
-            'owner_id': admin_user['_id'],
-            'members': [{
-                'user_id': admin_user['_id'],
-                'joined_at': datetime.utcnow(),
-                'role': 'admin'
-            }],
-            'max_members': None,
-            'is_active': True,
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        },
-        {
-            'name': 'Random',
-            'description': 'Random conversations and off-topic discussions',
-            'type': 'public',
+            'name': room['name'],
+            'description': room['description'],
+            'type': room['type'],
             'owner_id': admin_user['_id'],
             'members': [{
                 'user_id': admin_user['_id'],
-                'joined_at': datetime.utcnow(),
+                'joined_at': now,
                 'role': 'admin'
             }],
-            'max_members': None,
+            'max_members': room['max_members'],
             'is_active': True,
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
-        },
-        {
-            'name': 'Team Private',
-            'description': 'Private room for team discussions',
-            'type': 'private',
-            'owner_id': admin_user['_id'],
-            'members': [{
-                'user_id': admin_user['_id'],
-                'joined_at': datetime.utcnow(),
-                'role': 'admin'
-            }],
-            'max_members': 10,
-            'is_active': True,
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
+            'created_at': now,
+            'updated_at': now
         }
+        for room in new_rooms
     ]
     
-    for room in sample_rooms:
-        # Check if room already exists
-        if not rooms_collection.find_one({'name': room['name']}):
-            result = rooms_collection.insert_one(room)
-            print(f"Created room: {room['name']} (ID: {result.inserted_id})")
+    # Room names are only unique per type in the app (private rooms may reuse
+    # a public room's name), so rooms are upserted by (name, type)
+    result = rooms_collection.bulk_write(
+        [UpdateOne({'name': room['name'], 'type': room['type']}, {'$setOnInsert': room}, upsert=True)
+         for room in sample_rooms],
+        ordered=False
+    )
+    
+    for index, room in enumerate(sample_rooms):
+        if index in result.upserted_ids:
+            print(f"Created room: {room['name']} (ID: {result.upserted_ids[index]})")
         else:
             print(f"Room {room['name']} already exists, skipping...")
 
@@ -170,72 +187,83 @@ def create_sample_messages():
     """Create some sample messages"""
     print("Creating sample messages...")
     
-    # Get general room and users
-    general_room = rooms_collection.find_one({'name': 'General'})
-    admin_user = users_collection.find_one({'username': 'admin'})
-    john_user = users_collection.find_one({'username': 'john_doe'})
+    # Get the rooms and senders' IDs with one query each
+    fixtures = FIXTURES['messages']
+    # Room names are only unique per type (private rooms may reuse a public
+    # room's name), so rooms are matched on (name, type)
+    room_keys = {(message['room'], message['room_type']) for message in fixtures}
+    room_ids = {(room['name'], room['type']): room['_id'] for room in rooms_collection.find(
+        {'$or': [{'name': name, 'type': room_type} for name, room_type in room_keys]},
+        {'_id': 1, 'name': 1, 'type': 1}
+    )}
+    user_ids = {user['username']: user['_id'] for user in users_collection.find(
+        {'username': {'$in': list({message['sender'] for message in fixtures})}}, {'_id': 1, 'username': 1}
+    )}
     
-    if not all([general_room, admin_user, john_user]):
+    if not all((message['room'], message['room_type']) in room_ids and message['sender'] in user_ids
+               for message in fixtures):
         print("Required room or users not found. Please create rooms and users first.")
         return
     
+    # Skip if the sample messages were already seeded, instead of inserting duplicates
+    if messages_collection.estimated_document_count() and messages_collection.count_documents({
+        'room_id': {'$in': list(room_ids.values())},
+        'content': {'$in': [message['content'] for message in fixtures]}
+    }, limit=1):
+        print("Sample messages already exist, skipping...")
+        return
+    
+    # Messages are spaced a second apart so they keep their order when sorted by timestamp
+    now = datetime.utcnow()
     sample_messages = [
         {
-            'room_id': general_room['_id'],
-            'sender_id': admin_user['_id'],
-            'content': 'Welcome to the chat application! Feel free to start conversations here.',
+            'room_id': room_ids[(message['room'], message['room_type'])],
+            'sender_id': user_ids[message['sender']],
+            'content': message['content'],
             'message_type': 'text',
             'edited': False,
             'deleted': False,
-            'timestamp': datetime.utcnow()
-        },
-        {
-            'room_id': general_room['_id'],
-            'sender_id': john_user['_id'],
-            'content': 'Hello everyone! Great to be here. This chat app looks amazing!',
-            'message_type': 'text',
-            'edited': False,
-            'deleted': False,
-            'timestamp': datetime.utcnow()
-        },
-        {
-            'room_id': general_room['_id'],
-            'sender_id': admin_user['_id'],
-            'content': 'Thanks! The app supports real-time messaging, multiple rooms, and user authentication.',
-            'message_type': 'text',
-            'edited': False,
-            'deleted': False,
-            'timestamp': datetime.utcnow()
+            'timestamp': now + timedelta(seconds=index)
         }
+        for index, message in enumerate(fixtures)
     ]
     
+    fast_messages_collection.insert_many(sample_messages, ordered=False)
     for message in sample_messages:
-        result = messages_collection.insert_one(message)
-        print(f"Created message: {message['content'][:50]}... (ID: {result.inserted_id})")
+        print(f"Created message: {message['content'][:50]}... (ID: {message['_id']})")
 
 def create_indexes():
     """Create database indexes for better performance"""
     print("Creating database indexes...")
     
     try:
+        # One createIndexes command per collection
         # Users collection indexes
-        users_collection.create_index('username', unique=True)
-        users_collection.create_index('email', unique=True)
-        users_collection.create_index('is_online')
+        users_collection.create_indexes([
+            IndexModel('username', unique=True),
+            IndexModel('email', unique=True),
+            IndexModel('is_online')
+        ])
         print("Created users collection indexes")
         
         # Rooms collection indexes
-        rooms_collection.create_index('name')
-        rooms_collection.create_index('type')
-        rooms_collection.create_index('owner_id')
-        rooms_collection.create_index('members.user_id')
+        rooms_collection.create_indexes([
+            IndexModel('name'),
+            IndexModel('type'),
+            IndexModel('room_id', unique=True, sparse=True),  # Only private rooms have a room_id
+            IndexModel('owner_id'),
+            IndexModel([('members.user_id', ASCENDING), ('type', ASCENDING), ('is_active', ASCENDING)]),
+            IndexModel([('type', ASCENDING), ('is_active', ASCENDING), ('name', ASCENDING)])
+        ])
         print("Created rooms collection indexes")
         
         # Messages collection indexes
-        messages_collection.create_index('room_id')
-        messages_collection.create_index('sender_id')
-        messages_collection.create_index('timestamp')
-        messages_collection.create_index([('room_id', 1), ('timestamp', -1)])
+        messages_collection.create_indexes([
+            IndexModel('room_id'),
+            IndexModel('sender_id'),
+            IndexModel('timestamp'),
+            IndexModel([('room_id', ASCENDING), ('timestamp', DESCENDING)])
+        ])
         print("Created messages collection indexes")
         
     except Exception as e:
@@ -247,58 +275,65 @@ def clear_all_data():
     
     confirmation = input("Are you sure you want to delete all data? Type 'yes' to confirm: ")
     if confirmation.lower() == 'yes':
-        users_collection.delete_many({})
-        rooms_collection.delete_many({})
-        messages_collection.delete_many({})
+        # Dropping is a metadata operation, unlike deleting every document
+        users_collection.drop()
+        rooms_collection.drop()
+        messages_collection.drop()
         print("All data cleared successfully!")
+        
+        # drop() also removes the indexes, so put them back
+        create_indexes()
     else:
         print("Data clearing cancelled.")
 
+def seed_all():
+    """Create users, rooms, messages and indexes in one go"""
+    create_sample_users()
+    create_sample_rooms()
+    create_sample_messages()
+    create_indexes()
+    print("\n✅ All sample data created successfully!")
+    print("\nSample login credentials:")
+    for user in FIXTURES['users']:
+        print(f"Username: {user['username']}, Password: {user['password']}")
+
+# Menu choices mapped to their actions
+MENU_ACTIONS = {
+    '1': create_sample_users,
+    '2': create_sample_rooms,
+    '3': create_sample_messages,
+    '4': create_indexes,
+    '5': seed_all,
+    '6': clear_all_data
+}
+
 def main():
     """Main function to run the seeder"""
-    print("=== Chat Application Database Seeder ===")
-    print("1. Create sample users")
-    print("2. Create sample rooms")
-    print("3. Create sample messages")
-    print("4. Create database indexes")
-    print("5. Seed all data (users + rooms + messages + indexes)")
-    print("6. Clear all data (DANGER!)")
-    print("0. Exit")
-    
-    choice = input("\nEnter your choice (0-6): ").strip()
-    
-    if choice == '1':
-        create_sample_users()
-    elif choice == '2':
-        create_sample_rooms()
-    elif choice == '3':
-        create_sample_messages()
-    elif choice == '4':
-        create_indexes()
-    elif choice == '5':
-        create_sample_users()
-        create_sample_rooms()
-        create_sample_messages()
-        create_indexes()
-        print("\n✅ All sample data created successfully!")
-        print("\nSample login credentials:")
-        print("Username: admin, Password: admin123")
-        print("Username: john_doe, Password: password123")
-        print("Username: jane_smith, Password: password123")
-        print("Username: bob_wilson, Password: password123")
-    elif choice == '6':
-        clear_all_data()
-    elif choice == '0':
-        print("Goodbye!")
-        return
-    else:
-        print("Invalid choice. Please try again.")
-    
-    # Ask if user wants to continue
-    if choice != '0':
+    while True:
+        print("=== Chat Application Database Seeder ===")
+        print("1. Create sample users")
+        print("2. Create sample rooms")
+        print("3. Create sample messages")
+        print("4. Create database indexes")
+        print("5. Seed all data (users + rooms + messages + indexes)")
+        print("6. Clear all data (DANGER!)")
+        print("0. Exit")
+        
+        choice = input("\nEnter your choice (0-6): ").strip()
+        
+        action = MENU_ACTIONS.get(choice)
+        if action:
+            action()
+        elif choice == '0':
+            print("Goodbye!")
+            return
+        else:
+            print("Invalid choice. Please try again.")
+        
+        # Ask if user wants to continue
         continue_choice = input("\nDo you want to perform another action? (y/n): ").strip().lower()
-        if continue_choice == 'y':
-            main()
+        if continue_choice != 'y':
+            return
 
 if __name__ == '__main__':
     main()
\ No newline at end of file